@@ -8,6 +8,7 @@ from pgvector.psycopg import register_vector
 import httpx
 import json
 from typing import Optional
+from contextlib import asynccontextmanager
 from scripts.token_manager import get_access_token
 from scripts.outlook import (
     reply_to_message,
@@ -15,12 +16,36 @@ from scripts.outlook import (
     send_notification_email,
     move_notification_emails,
 )
+from scripts.embedding_storage import (
+    get_storage_mode,
+    search_templates,
+    get_template_distance,
+)
+from scripts.template_catalog import (
+    get_snapshot,
+    refresh_snapshot,
+    start_catalog_listener,
+)
+from scripts.lexical_classifier import (
+    get_index as get_lexical_index,
+    get_stats as get_lexical_stats,
+    record_match,
+)
 
 # Load environment variables from .env file.
 load_dotenv()
 
 MS_GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the template catalog once and keep it fresh via LISTEN/NOTIFY.
+    start_catalog_listener(os.getenv("DB_CONNECTION"))
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Instantiate the AzureOpenAI client.
 client = AzureOpenAI(
@@ -29,6 +54,10 @@ client = AzureOpenAI(
     azure_endpoint=os.environ.get("OPENAI_ENDPOINT"),
 )
 
+# Storage mode of the template embeddings (vector, halfvec or binary). Only
+# used for catalogs ingested before the mode was recorded in template_catalog.
+EMBEDDING_STORAGE = get_storage_mode()
+
 
 class EmailData(BaseModel):
     sender: str
@@ -38,6 +67,144 @@ class EmailData(BaseModel):
     message_id: Optional[str] = None
 
 
+def find_template_by_embedding(snapshot, combined_text):
+    """
+    Match an email against the templates with an embedding similarity search.
+    Returns (content, metadata, distance), or None if no template matched.
+    """
+    # Search with the storage mode the catalog was actually ingested with.
+    storage_mode = snapshot.storage_mode or EMBEDDING_STORAGE
+    if storage_mode != EMBEDDING_STORAGE:
+        print(
+            f"WARNING: EMBEDDING_STORAGE is '{EMBEDDING_STORAGE}' but the template "
+            f"catalog was ingested with '{storage_mode}', using '{storage_mode}'"
+        )
+
+    DB_CONNECTION = os.getenv("DB_CONNECTION")
+    with psycopg.connect(DB_CONNECTION) as conn:
+        register_vector(conn)
+
+        # 1. Create an embedding for the incoming email.
+        embedding_response = client.embeddings.create(
+            model=os.environ.get(
+                "AZURE_OPENAI_DEPLOYMENT"
+            ),  # Use your deployment name here.
+            input=combined_text,
+        )
+        incoming_embedding = embedding_response.data[0].embedding
+        print("Embedding created")
+
+        # 2. Perform similarity search in the templates table.
+        with conn.cursor() as cursor:
+            search_results = search_templates(
+                cursor, incoming_embedding, storage_mode
+            )
+            print(f"Similarity search performed ({storage_mode} storage)")
+
+            # Rows missing from the snapshot mean a new catalog was committed
+            # that the listener has not loaded yet, so load it now.
+            if any(snapshot.get(content) is None for content, _ in search_results):
+                print(
+                    f"Search returned templates missing from catalog version "
+                    f"{snapshot.version}, reloading the catalog"
+                )
+                snapshot = refresh_snapshot(DB_CONNECTION)
+
+            # Attach metadata from the snapshot, skipping rows it still does not
+            # know about so the request sees one consistent catalog version.
+            dropped = [
+                content
+                for content, _ in search_results
+                if snapshot.get(content) is None
+            ]
+            if dropped:
+                print(
+                    f"WARNING: Dropped {len(dropped)} search results missing from "
+                    f"catalog version {snapshot.version}"
+                )
+            all_results = [
+                (template_content, snapshot.get(template_content), template_distance)
+                for template_content, template_distance in search_results
+                if snapshot.get(template_content) is not None
+            ]
+
+            # Print all template matches and scores
+            print("\n=== All Template Matches ===")
+            for idx, template_result in enumerate(all_results):
+                template_content, template_metadata, template_distance = template_result
+                template_subject = template_metadata.get("subject", "Unknown")
+                similarity_score = (
+                    1 - template_distance
+                )  # Convert distance to similarity
+                print(
+                    f"{idx+1}. '{template_subject}' - Similarity: {similarity_score:.4f}"
+                )
+            print("===========================\n")
+
+        if not all_results:
+            return None
+
+        # Get the best match (first result)
+        result = all_results[0]
+        content, metadata_json, distance = result
+        best_similarity = 1 - distance
+
+        # Define threshold for good matches
+        SIMILARITY_THRESHOLD = 0.25
+
+        # Check if best similarity is below threshold
+        if best_similarity < SIMILARITY_THRESHOLD:
+            print(
+                f"Best match similarity ({best_similarity:.4f}) below threshold ({SIMILARITY_THRESHOLD})"
+            )
+
+            # Find the generic template in the results
+            generic_template = None
+            for template_result in all_results:
+                template_content, template_metadata, template_distance = (
+                    template_result
+                )
+                if (
+                    template_metadata.get("subject")
+                    == "General Customer Inquiry Acknowledgment"
+                ):
+                    generic_template = template_result
+                    break
+
+            # Binary mode only returns the reranked candidates, so take
+            # the generic template from the snapshot if it was not among them.
+            if not generic_template:
+                generic_match = snapshot.find_by_subject(
+                    "General Customer Inquiry Acknowledgment"
+                )
+                if generic_match:
+                    generic_content, generic_metadata = generic_match
+                    with conn.cursor() as cursor:
+                        generic_distance = get_template_distance(
+                            cursor,
+                            incoming_embedding,
+                            storage_mode,
+                            generic_content,
+                        )
+                    if generic_distance is not None:
+                        generic_template = (
+                            generic_content,
+                            generic_metadata,
+                            generic_distance,
+                        )
+
+            # Use the generic template if found
+            if generic_template:
+                print("Falling back to Generic Customer Inquiry template")
+                result = generic_template
+            else:
+                print(
+                    "WARNING: Generic template not found in results, using best match anyway"
+                )
+
+        return result
+
+
 @app.post("/email")
 async def process_email(email: EmailData):
     print("Received email")
@@ -71,138 +238,96 @@ async def process_email(email: EmailData):
         if message_response.status_code == 200:
             message_data = message_response.json()
 
-    DB_CONNECTION = os.getenv("DB_CONNECTION")
-    conn = psycopg.connect(DB_CONNECTION)
-    register_vector(conn)
-
     # Combine subject and body for embedding.
     combined_text = f"{email.subject}\n{email.body}"
 
     try:
-        # 1. Create an embedding for the incoming email.
-        embedding_response = client.embeddings.create(
-            model=os.environ.get(
-                "AZURE_OPENAI_DEPLOYMENT"
-            ),  # Use your deployment name here.
-            input=combined_text,
-        )
-        incoming_embedding = embedding_response.data[0].embedding
-        print("Embedding created")
-
-        # 2. Perform similarity search in the templates table.
-        with conn.cursor() as cursor:
-            query = """
-                SELECT content, metadata, (embedding <=> %s::vector) AS distance
-                FROM templates
-                ORDER BY embedding <=> %s::vector
-            """
-            cursor.execute(query, (incoming_embedding, incoming_embedding))
-            all_results = cursor.fetchall()
-            print("Similarity search performed")
-
-            # Print all template matches and scores
-            print("\n=== All Template Matches ===")
-            for idx, template_result in enumerate(all_results):
-                template_content, template_metadata, template_distance = template_result
-                template_subject = template_metadata.get("subject", "Unknown")
-                similarity_score = (
-                    1 - template_distance
-                )  # Convert distance to similarity
-                print(
-                    f"{idx+1}. '{template_subject}' - Similarity: {similarity_score:.4f}"
-                )
-            print("===========================\n")
-
-        if not all_results:
-            return {"status": "No matching template found"}
+        # Use a single catalog snapshot for the whole request, loading it here
+        # if the listener has not managed to yet.
+        snapshot = get_snapshot()
+        if not snapshot.templates:
+            snapshot = refresh_snapshot(os.getenv("DB_CONNECTION"))
+
+        # Try the local lexical index first and only fall through to the
+        # embedding search when its best match is ambiguous.
+        lexical_match = get_lexical_index(snapshot).classify(combined_text)
+        if lexical_match:
+            content, lexical_score, lexical_confidence = lexical_match
+            metadata_json = snapshot.get(content)
+            distance = None
+            record_match("lexical")
+            print(
+                f"Lexical match found (score: {lexical_score:.2f}, confidence: {lexical_confidence:.2f})"
+            )
         else:
-            # Get the best match (first result)
-            result = all_results[0]
+            result = find_template_by_embedding(snapshot, combined_text)
+            if not result:
+                print("No matching template found, no reply sent")
+                return {"status": "No matching template found"}
             content, metadata_json, distance = result
-            best_similarity = 1 - distance
-
-            # Define threshold for good matches
-            SIMILARITY_THRESHOLD = 0.25
+            record_match("embedding")
 
-            # Check if best similarity is below threshold
-            if best_similarity < SIMILARITY_THRESHOLD:
-                print(
-                    f"Best match similarity ({best_similarity:.4f}) below threshold ({SIMILARITY_THRESHOLD})"
-                )
+        # Parse metadata JSON (assuming it's already a dict)
+        metadata = metadata_json
+        priority = metadata.get("priority", "no action")
 
-                # Find the generic template in the results
-                generic_template = None
-                for template_result in all_results:
-                    template_content, template_metadata, template_distance = (
-                        template_result
-                    )
-                    if (
-                        template_metadata.get("subject")
-                        == "General Customer Inquiry Acknowledgment"
-                    ):
-                        generic_template = template_result
-                        break
-
-                # Use the generic template if found
-                if generic_template:
-                    print("Falling back to Generic Customer Inquiry template")
-                    result = generic_template
-                    content, metadata_json, distance = result
-                else:
-                    print(
-                        "WARNING: Generic template not found in results, using best match anyway"
-                    )
-
-            # Parse metadata JSON (assuming it's already a dict)
-            metadata = metadata_json
-            priority = metadata.get("priority", "no action")
-
-            # Print best match information
-            print(f"Selected template: '{metadata.get('subject', 'Unknown')}'")
+        # Print best match information
+        print(f"Selected template: '{metadata.get('subject', 'Unknown')}'")
+        if distance is not None:
             print(f"Final similarity score: {1 - distance:.4f}")
-            print(f"Template found with priority: {priority}")
-
-            # Continue with the existing code...
-            reply_body = metadata.get("body", "").replace("/n", "<br>")
-
-            # 3. Determine the message ID.
-            message_id = email.message_id
-            if not message_id:
-                # Update search endpoint for application permissions
-                search_endpoint = f"{MS_GRAPH_BASE_URL}/users/{user_id}/messages"
-                params = {"$filter": f"subject eq '{email.subject}'", "$top": "1"}
-                search_response = httpx.get(
-                    search_endpoint, headers=headers, params=params
+        print(f"Template found with priority: {priority}")
+
+        # Continue with the existing code...
+        reply_body = metadata.get("body", "").replace("/n", "<br>")
+
+        # 3. Determine the message ID.
+        message_id = email.message_id
+        if not message_id:
+            # Update search endpoint for application permissions
+            search_endpoint = f"{MS_GRAPH_BASE_URL}/users/{user_id}/messages"
+            params = {"$filter": f"subject eq '{email.subject}'", "$top": "1"}
+            search_response = httpx.get(
+                search_endpoint, headers=headers, params=params
+            )
+            search_response.raise_for_status()
+            messages = search_response.json().get("value", [])
+            if not messages:
+                raise HTTPException(
+                    status_code=404, detail="Original message not found"
                 )
-                search_response.raise_for_status()
-                messages = search_response.json().get("value", [])
-                if not messages:
-                    raise HTTPException(
-                        status_code=404, detail="Original message not found"
-                    )
-                message_id = messages[0].get("id")
-
-            # 4. Send the reply using the reply_to_message function.
-            success = reply_to_message(headers, message_id, reply_body, user_id)
-
-            # 5. Send notification based on priority only if reply was successful
-            notification_result = None
-            if success:
-                notification_result = send_notification_email(email, priority, user_id)
-                return {
-                    "status": "Email processed and reply sent successfully",
-                    "template": content,
-                    "notification": notification_result,
-                    "priority": priority,
-                    "distance": distance,
-                }
-            else:
-                raise HTTPException(status_code=500, detail="Failed to send reply")
+            message_id = messages[0].get("id")
+
+        # 4. Send the reply using the reply_to_message function.
+        success = reply_to_message(headers, message_id, reply_body, user_id)
+
+        # 5. Send notification based on priority only if reply was successful
+        notification_result = None
+        if success:
+            notification_result = send_notification_email(email, priority, user_id)
+            return {
+                "status": "Email processed and reply sent successfully",
+                "template": content,
+                "notification": notification_result,
+                "priority": priority,
+                "distance": distance,
+                "match_method": "lexical" if lexical_match else "embedding",
+            }
+        else:
+            raise HTTPException(status_code=500, detail="Failed to send reply")
     except Exception as e:
         print("Error processing email:", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/classifier-stats")
+async def classifier_stats():
+    """
+    Counts of emails matched by the lexical index versus the embedding search
+    in this worker, including the fraction handled locally.
+    """
+    return get_lexical_stats()
+
+
 @app.post("/move-notification-emails")
 async def move_notifications():
     """
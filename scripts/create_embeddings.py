@@ -5,6 +5,8 @@ import pandas as pd
 import psycopg
 from pgvector.psycopg import register_vector
 import json
+from embedding_storage import get_storage_mode, prepare_templates_table, insert_template
+from template_catalog import publish_catalog_update
 
 # Load environment variables
 load_dotenv()
@@ -22,10 +24,8 @@ DB_CONNECTION = os.getenv("DB_CONNECTION")
 conn = psycopg.connect(DB_CONNECTION)
 register_vector(conn)
 
-# Enable pgvector extension if not exists
-with conn.cursor() as cursor:
-    cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
-    conn.commit()
+# Storage mode for the template embeddings (vector, halfvec or binary)
+storage_mode = get_storage_mode()
 
 # Load the CSV file containing email templates (subject, body, and priority)
 csv_file = "data/email_templates.csv"
@@ -34,34 +34,53 @@ df = pd.read_csv(csv_file)
 # Clean up the headers: remove extra spaces and set to lowercase
 df.columns = df.columns.str.strip().str.lower()
 
-# Prepare and insert embeddings for each email template.
-with conn.cursor() as cursor:
-    for _, row in df.iterrows():
-        # Create the combined text from subject and body.
-        text = f"Subject: {row['subject']}. Body: {row['body']}."
+# Generate the embeddings for each email template.
+templates = []
+for _, row in df.iterrows():
+    # Create the combined text from subject and body.
+    text = f"Subject: {row['subject']}. Body: {row['body']}."
 
-        # Generate embedding using the Azure OpenAI client.
-        response = client.embeddings.create(
-            model=os.getenv(
-                "AZURE_OPENAI_DEPLOYMENT"
-            ),  # Use your deployment name as the model
-            input=[text],
-        )
-        embedding = response.data[0].embedding
+    # Generate embedding using the Azure OpenAI client.
+    response = client.embeddings.create(
+        model=os.getenv(
+            "AZURE_OPENAI_DEPLOYMENT"
+        ),  # Use your deployment name as the model
+        input=[text],
+    )
+    embedding = response.data[0].embedding
+
+    # Clean metadata (convert any NaN values to None)
+    metadata = row.to_dict()
+    metadata = {k: (None if pd.isna(v) else v) for k, v in metadata.items()}
 
-        # Clean metadata (convert any NaN values to None)
-        metadata = row.to_dict()
-        metadata = {k: (None if pd.isna(v) else v) for k, v in metadata.items()}
+    templates.append((text, embedding, json.dumps(metadata), row["priority"]))
 
-        # Insert the email template into the "email_templates" table.
-        cursor.execute(
-            """
-            INSERT INTO templates (content, embedding, metadata, priority)
-            VALUES (%s, %s, %s, %s)
-            """,
-            (text, embedding, json.dumps(metadata), row["priority"]),
+# Enable pgvector extension if not exists and add any quantized columns
+with conn.cursor() as cursor:
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    prepare_templates_table(cursor, storage_mode, len(templates[0][1]))
+    conn.commit()
+
+# Replace the email templates in the "templates" table, so each catalog
+# version contains exactly the templates in the CSV.
+with conn.cursor() as cursor:
+    cursor.execute("DELETE FROM templates")
+    for text, embedding, metadata_json, priority in templates:
+        insert_template(
+            cursor,
+            text,
+            embedding,
+            metadata_json,
+            priority,
+            storage_mode,
         )
+
+    # Bump the catalog version; the NOTIFY is delivered to workers on commit.
+    catalog_version = publish_catalog_update(cursor, storage_mode)
     conn.commit()
 
 conn.close()
-print("Email templates have been successfully added to the database.")
+print(
+    f"Email templates have been successfully replaced in the database "
+    f"({storage_mode} storage, catalog version {catalog_version})."
+)
@@ -0,0 +1,122 @@
+from openai import AzureOpenAI
+from dotenv import load_dotenv
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import psycopg
+from pgvector.psycopg import register_vector
+from embedding_storage import get_storage_mode, search_templates
+from template_catalog import load_snapshot
+
+# Load environment variables
+load_dotenv()
+
+# Initialize Azure OpenAI client with your environment variables.
+client = AzureOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    api_version="2024-10-21",
+    azure_endpoint=os.getenv("OPENAI_ENDPOINT"),
+    azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+)
+
+
+# Inputs per embeddings request, kept low to stay within Azure's per-request
+# input and token limits.
+EMBEDDING_BATCH_SIZE = 16
+
+
+def embed(texts):
+    embeddings = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        response = client.embeddings.create(
+            model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+            input=texts[start : start + EMBEDDING_BATCH_SIZE],
+        )
+        embeddings.extend(item.embedding for item in response.data)
+    return np.array(embeddings, dtype=np.float32)
+
+
+def load_csv(csv_file):
+    df = pd.read_csv(csv_file)
+    df.columns = df.columns.str.strip().str.lower()
+    return df
+
+
+def main():
+    """
+    Report recall@k of the ingested storage mode against a full precision baseline.
+
+    The baseline re-embeds the templates from the CSV and ranks them with exact
+    float32 cosine distance, so it works even when the database only holds
+    half precision vectors.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--templates", default="data/email_templates.csv")
+    parser.add_argument(
+        "--queries",
+        default=None,
+        help="CSV of sample emails with subject and body columns. "
+        "Defaults to the template subjects, which is only a smoke test.",
+    )
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    # Evaluate the storage mode the catalog was ingested with, if recorded.
+    storage_mode = (
+        load_snapshot(os.getenv("DB_CONNECTION")).storage_mode or get_storage_mode()
+    )
+
+    # Full precision template embeddings, using the same text as ingestion.
+    templates = load_csv(args.templates)
+    template_texts = [
+        f"Subject: {row['subject']}. Body: {row['body']}."
+        for _, row in templates.iterrows()
+    ]
+    template_embeddings = embed(template_texts)
+    template_embeddings /= np.linalg.norm(template_embeddings, axis=1, keepdims=True)
+
+    if args.queries:
+        queries = load_csv(args.queries)
+        query_texts = [
+            f"{row['subject']}\n{row['body']}" for _, row in queries.iterrows()
+        ]
+    else:
+        # Each subject is part of its own template text, so recall is close to
+        # 1.0 regardless of the storage mode.
+        print(
+            "WARNING: No --queries given, using the template subjects. This is a "
+            "smoke test only and does not measure quantization recall."
+        )
+        query_texts = templates["subject"].tolist()
+    query_embeddings = embed(query_texts)
+
+    conn = psycopg.connect(os.getenv("DB_CONNECTION"))
+    register_vector(conn)
+
+    recall_at_1 = []
+    recall_at_k = []
+    with conn.cursor() as cursor:
+        for query_embedding in query_embeddings:
+            # Baseline: exact cosine ranking in float32.
+            similarities = template_embeddings @ (
+                query_embedding / np.linalg.norm(query_embedding)
+            )
+            baseline = [template_texts[i] for i in np.argsort(-similarities)[: args.k]]
+
+            results = search_templates(cursor, query_embedding.tolist(), storage_mode)
+            candidates = [content for content, _ in results[: args.k]]
+
+            recall_at_1.append(float(candidates[:1] == baseline[:1]))
+            recall_at_k.append(len(set(candidates) & set(baseline)) / len(baseline))
+
+    conn.close()
+
+    print(f"Storage mode: {storage_mode}")
+    print(f"Queries: {len(query_texts)}")
+    print(f"Recall@1: {np.mean(recall_at_1):.4f}")
+    print(f"Recall@{args.k}: {np.mean(recall_at_k):.4f}")
+
+
+if __name__ == "__main__":
+    main()
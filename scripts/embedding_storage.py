@@ -0,0 +1,145 @@
+import os
+
+# Supported storage modes for template embeddings:
+#   "vector"  - full precision float32 vectors (original behaviour)
+#   "halfvec" - half precision vectors only, searched directly
+#   "binary"  - binary quantized vectors for the candidate scan, with the
+#               full precision vectors kept for reranking the top candidates
+STORAGE_MODES = ("vector", "halfvec", "binary")
+
+DEFAULT_RERANK_CANDIDATES = 10
+
+
+def get_storage_mode():
+    """
+    Read the embedding storage mode from the EMBEDDING_STORAGE environment variable.
+    """
+    mode = os.getenv("EMBEDDING_STORAGE", "vector").strip().lower()
+    if mode not in STORAGE_MODES:
+        raise ValueError(
+            f"Invalid EMBEDDING_STORAGE: {mode}. Must be one of {', '.join(STORAGE_MODES)}"
+        )
+    return mode
+
+
+def get_rerank_candidates():
+    """
+    Number of binary quantized candidates passed to the full precision rerank.
+    """
+    return int(os.getenv("RERANK_CANDIDATES", DEFAULT_RERANK_CANDIDATES))
+
+
+def prepare_templates_table(cursor, mode, dimensions):
+    """
+    Add the quantized embedding columns needed by the given storage mode,
+    sized to the embedding dimensions.
+    """
+    dimensions = int(dimensions)
+    if mode == "halfvec":
+        # Half precision mode does not keep the full precision vector.
+        cursor.execute(
+            f"ALTER TABLE templates ADD COLUMN IF NOT EXISTS embedding_half halfvec({dimensions})"
+        )
+        cursor.execute(
+            f"ALTER TABLE templates ALTER COLUMN embedding_half TYPE halfvec({dimensions})"
+        )
+        cursor.execute("ALTER TABLE templates ALTER COLUMN embedding DROP NOT NULL")
+    elif mode == "binary":
+        # A bare "bit" column means bit(1), so the length must match the embedding.
+        cursor.execute(
+            f"ALTER TABLE templates ADD COLUMN IF NOT EXISTS embedding_bin bit({dimensions})"
+        )
+        cursor.execute(
+            f"ALTER TABLE templates ALTER COLUMN embedding_bin TYPE bit({dimensions})"
+        )
+
+
+def insert_template(cursor, text, embedding, metadata_json, priority, mode):
+    """
+    Insert a template row, storing its embedding according to the storage mode.
+    """
+    if mode == "halfvec":
+        cursor.execute(
+            """
+            INSERT INTO templates (content, embedding_half, metadata, priority)
+            VALUES (%s, %s::halfvec, %s, %s)
+            """,
+            (text, embedding, metadata_json, priority),
+        )
+    elif mode == "binary":
+        cursor.execute(
+            """
+            INSERT INTO templates (content, embedding, embedding_bin, metadata, priority)
+            VALUES (%s, %s::vector, binary_quantize(%s::vector), %s, %s)
+            """,
+            (text, embedding, embedding, metadata_json, priority),
+        )
+    else:
+        cursor.execute(
+            """
+            INSERT INTO templates (content, embedding, metadata, priority)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (text, embedding, metadata_json, priority),
+        )
+
+
+def search_templates(cursor, embedding, mode, rerank_candidates=None):
+    """
+    Return (content, distance) rows ordered by cosine distance. Template
+    metadata is served from the in-process catalog snapshot instead.
+
+    In binary mode only the top `rerank_candidates` rows by Hamming distance
+    are returned, reranked by their full precision cosine distance.
+    """
+    if mode == "halfvec":
+        query = """
+            SELECT content, (embedding_half <=> %(embedding)s::halfvec) AS distance
+            FROM templates
+            ORDER BY distance
+        """
+    elif mode == "binary":
+        query = """
+            SELECT content, (embedding <=> %(embedding)s::vector) AS distance
+            FROM (
+                SELECT content, embedding
+                FROM templates
+                ORDER BY embedding_bin <~> binary_quantize(%(embedding)s::vector)
+                LIMIT %(limit)s
+            ) AS candidates
+            ORDER BY distance
+        """
+    else:
+        query = """
+            SELECT content, (embedding <=> %(embedding)s::vector) AS distance
+            FROM templates
+            ORDER BY distance
+        """
+
+    if rerank_candidates is None:
+        rerank_candidates = get_rerank_candidates()
+
+    cursor.execute(query, {"embedding": embedding, "limit": rerank_candidates})
+    return cursor.fetchall()
+
+
+def get_template_distance(cursor, embedding, mode, content):
+    """
+    Return the cosine distance between the embedding and a single template.
+    """
+    if mode == "halfvec":
+        distance = "embedding_half <=> %(embedding)s::halfvec"
+    else:
+        distance = "embedding <=> %(embedding)s::vector"
+
+    cursor.execute(
+        f"""
+        SELECT {distance}
+        FROM templates
+        WHERE content = %(content)s
+        LIMIT 1
+        """,
+        {"embedding": embedding, "content": content},
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
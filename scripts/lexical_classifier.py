@@ -0,0 +1,205 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+# Default cutoffs are the ones recommended by scripts/lexical_eval.py on
+# data/lexical_eval.csv; re-run it after changing the templates.
+
+# Minimum confidence (1 - runner-up score / best score) for a lexical match to
+# skip the embedding path. Set above 1 to always use embeddings.
+DEFAULT_CONFIDENCE_THRESHOLD = 0.75
+
+# Minimum BM25 score of the best template, so a few shared words are not
+# enough to resolve an email locally.
+DEFAULT_MIN_SCORE = 18.0
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Tokens are truncated to this many characters, a cheap stemmer so that e.g.
+# "cancel" matches "cancellation" and "colours" matches "colour".
+STEM_LENGTH = 5
+
+# British spellings are mapped to US ones before truncation, which would
+# otherwise turn "colour" into "colou" but "color" into "color".
+SPELLING_VARIANTS = {
+    "colour": "color",
+    "colours": "colors",
+    "coloured": "colored",
+    "favourite": "favorite",
+    "cheque": "check",
+    "catalogue": "catalog",
+}
+
+# Negation flips the meaning of an otherwise matching email ("please do not
+# cancel my order"), which a bag of words cannot tell apart, so any email
+# containing one is left to the embedding path.
+NEGATION_PATTERN = re.compile(
+    r"\b(?:no|not|never|none|nothing|nor|neither|without|cannot|cant|dont|"
+    r"doesnt|didnt|wont|isnt|wasnt|arent|werent|havent|hasnt|hadnt|shouldnt|"
+    r"wouldnt|couldnt)\b|n['\u2019]t\b"
+)
+
+# Negation words are deliberately not stopwords, so they still count towards
+# the scores of templates that contain them.
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "for",
+    "from", "has", "have", "hello", "hi", "i", "if", "in", "is", "it", "me",
+    "my", "of", "on", "or", "our", "please", "so", "that", "the", "this", "to",
+    "us", "was", "we", "what", "when", "will", "with", "you", "your",
+}
+
+
+def tokenize(text):
+    # Template bodies use "/n" as a line break marker.
+    text = (text or "").replace("/n", " ").lower()
+    return [
+        SPELLING_VARIANTS.get(token, token)[:STEM_LENGTH]
+        for token in TOKEN_PATTERN.findall(text)
+        if token not in STOPWORDS
+    ]
+
+
+def has_negation(text):
+    return NEGATION_PATTERN.search((text or "").lower()) is not None
+
+
+def get_confidence_threshold():
+    return float(
+        os.getenv("LEXICAL_CONFIDENCE_THRESHOLD", DEFAULT_CONFIDENCE_THRESHOLD)
+    )
+
+
+def get_min_score():
+    return float(os.getenv("LEXICAL_MIN_SCORE", DEFAULT_MIN_SCORE))
+
+
+class LexicalIndex:
+    """
+    BM25 index over template subjects and bodies.
+    """
+
+    def __init__(self, templates, k1=1.5, b=0.75):
+        # templates: content -> metadata, as held by the catalog snapshot.
+        self.k1 = k1
+        self.b = b
+        self.contents = []
+        self.doc_lengths = []
+        self.postings = defaultdict(list)  # term -> [(doc index, term frequency)]
+
+        for content, metadata in templates.items():
+            # Count the subject twice, it is the most specific part of a template.
+            subject = metadata.get("subject") or ""
+            tokens = tokenize(f"{subject} {subject} {metadata.get('body') or ''}")
+            doc_index = len(self.contents)
+            self.contents.append(content)
+            self.doc_lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                self.postings[term].append((doc_index, frequency))
+
+        doc_count = len(self.contents)
+        self.average_length = sum(self.doc_lengths) / doc_count if doc_count else 0
+        self.idf = {
+            term: math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def score(self, text):
+        """
+        Return (content, score) pairs for templates sharing a term with the text,
+        best match first.
+        """
+        scores = defaultdict(float)
+        for term, query_frequency in Counter(tokenize(text)).items():
+            for doc_index, frequency in self.postings.get(term, ()):
+                length_norm = 1 - self.b + self.b * (
+                    self.doc_lengths[doc_index] / self.average_length
+                )
+                scores[doc_index] += (
+                    self.idf[term]
+                    * frequency
+                    * (self.k1 + 1)
+                    / (frequency + self.k1 * length_norm)
+                    * query_frequency
+                )
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [(self.contents[doc_index], score) for doc_index, score in ranked]
+
+    def classify(self, text, confidence_threshold=None, min_score=None):
+        """
+        Return (content, score, confidence) for a high-confidence match, or None
+        when the result is ambiguous or negated and the embedding path should decide.
+        """
+        if has_negation(text):
+            return None
+
+        if confidence_threshold is None:
+            confidence_threshold = get_confidence_threshold()
+        if min_score is None:
+            min_score = get_min_score()
+
+        ranked = self.score(text)
+        if not ranked:
+            return None
+
+        best_content, best_score = ranked[0]
+        runner_up_score = ranked[1][1] if len(ranked) > 1 else 0.0
+        confidence = 1 - runner_up_score / best_score if best_score > 0 else 0.0
+
+        if best_score < min_score or confidence < confidence_threshold:
+            return None
+        return best_content, best_score, confidence
+
+
+# One index per catalog snapshot, rebuilt on the first request after a reload.
+_index_cache = (None, None)  # (snapshot, index)
+
+
+def get_index(snapshot):
+    """
+    Return the lexical index for the given template catalog snapshot.
+    """
+    global _index_cache
+    cached_snapshot, index = _index_cache
+    if cached_snapshot is not snapshot:
+        index = LexicalIndex(snapshot.templates)
+        _index_cache = (snapshot, index)
+
+        # Near-duplicate templates tie with each other and are never resolved
+        # locally. Re-running ingestion replaces the catalog and clears them.
+        subjects = Counter(
+            metadata.get("subject") for metadata in snapshot.templates.values()
+        )
+        duplicates = [subject for subject, count in subjects.items() if count > 1]
+        if duplicates:
+            print(
+                "WARNING: Template catalog has duplicate subjects, lexical matching "
+                f"will defer to embeddings for: {', '.join(map(str, duplicates))}"
+            )
+    return index
+
+
+_stats_lock = threading.Lock()
+_stats = {"lexical": 0, "embedding": 0}
+
+
+def record_match(method):
+    """
+    Count an email as resolved by the "lexical" or "embedding" path.
+    """
+    with _stats_lock:
+        _stats[method] += 1
+
+
+def get_stats():
+    with _stats_lock:
+        lexical = _stats["lexical"]
+        embedding = _stats["embedding"]
+    total = lexical + embedding
+    return {
+        "lexical": lexical,
+        "embedding": embedding,
+        "total": total,
+        "lexical_fraction": lexical / total if total else 0.0,
+    }
@@ -0,0 +1,122 @@
+import argparse
+import csv
+from lexical_classifier import (
+    LexicalIndex,
+    DEFAULT_CONFIDENCE_THRESHOLD,
+    DEFAULT_MIN_SCORE,
+)
+
+# Confidence below 0.5 would let a template win with less than twice the
+# runner-up's score, which is not a clear match however the data looks.
+CONFIDENCE_THRESHOLDS = [round(0.05 * step, 2) for step in range(10, 20)]
+MIN_SCORES = [float(score) for score in range(21)]
+
+
+def load_csv(csv_file):
+    with open(csv_file, newline="", encoding="utf-8") as file:
+        return [
+            {key.strip().lower(): value for key, value in row.items()}
+            for row in csv.DictReader(file)
+        ]
+
+
+def evaluate(index, subjects, emails, confidence_threshold, min_score):
+    """
+    Classify every labelled email and count correct and wrong local matches.
+    Falling through to the embedding path is never counted as wrong.
+    """
+    results = []
+    correct = wrong = 0
+    for email in emails:
+        text = f"{email['subject']}\n{email['body']}"
+        match = index.classify(text, confidence_threshold, min_score)
+        predicted = subjects[match[0]] if match else None
+        if predicted is not None:
+            if predicted == email["expected"]:
+                correct += 1
+            else:
+                wrong += 1
+        results.append((email, predicted, match))
+    return correct, wrong, results
+
+
+def main():
+    """
+    Sweep the lexical pre-classifier cutoffs over a labelled set of emails.
+
+    Each email is labelled with the template subject it should get, or left
+    empty if it must go to the embedding path. The recommended cutoffs are the
+    ones that resolve the most emails locally without a single wrong reply.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--templates", default="data/email_templates.csv")
+    parser.add_argument("--emails", default="data/lexical_eval.csv")
+    parser.add_argument("--confidence-threshold", type=float, default=None)
+    parser.add_argument("--min-score", type=float, default=None)
+    args = parser.parse_args()
+
+    # Index the templates the same way the catalog snapshot holds them.
+    templates = {
+        f"Subject: {row['subject']}. Body: {row['body']}.": row
+        for row in load_csv(args.templates)
+    }
+    subjects = {content: row["subject"] for content, row in templates.items()}
+    index = LexicalIndex(templates)
+    emails = load_csv(args.emails)
+
+    if args.confidence_threshold is not None or args.min_score is not None:
+        confidence_threshold = (
+            args.confidence_threshold
+            if args.confidence_threshold is not None
+            else DEFAULT_CONFIDENCE_THRESHOLD
+        )
+        min_score = (
+            args.min_score if args.min_score is not None else DEFAULT_MIN_SCORE
+        )
+        correct, wrong, results = evaluate(
+            index, subjects, emails, confidence_threshold, min_score
+        )
+        for email, predicted, match in results:
+            status = "embedding"
+            if predicted is not None:
+                status = "correct" if predicted == email["expected"] else "WRONG"
+            detail = f" -> '{predicted}' ({match[1]:.2f}, {match[2]:.2f})" if match else ""
+            print(f"[{status}] {email['subject']}{detail}")
+        print(
+            f"Confidence {confidence_threshold}, min score {min_score}: "
+            f"{correct} correct, {wrong} wrong, {len(emails)} emails"
+        )
+        return
+
+    # Most emails resolved locally with no wrong replies, preferring the
+    # stricter cutoffs among equally good settings.
+    best = None
+    for confidence_threshold in CONFIDENCE_THRESHOLDS:
+        for min_score in MIN_SCORES:
+            correct, wrong, _ = evaluate(
+                index, subjects, emails, confidence_threshold, min_score
+            )
+            if wrong:
+                continue
+            candidate = (correct, confidence_threshold, min_score)
+            if best is None or candidate > best:
+                best = candidate
+
+    answerable = sum(1 for email in emails if email["expected"])
+    print(f"Emails: {len(emails)} ({answerable} with a clearly matching template)")
+    if best is None:
+        print("No cutoffs avoid wrong replies, keep the lexical path disabled.")
+        return
+    correct, confidence_threshold, min_score = best
+    print(
+        f"Recommended cutoffs: LEXICAL_CONFIDENCE_THRESHOLD={confidence_threshold} "
+        f"LEXICAL_MIN_SCORE={min_score}"
+    )
+    print(
+        f"Resolved locally: {correct}/{len(emails)} "
+        f"({correct / len(emails):.0%}), 0 wrong"
+    )
+
+
+if __name__ == "__main__":
+    main()
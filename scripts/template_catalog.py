@@ -0,0 +1,169 @@
+import threading
+import time
+from dataclasses import dataclass, field
+import psycopg
+
+# Channel used to announce that the templates table has been updated.
+NOTIFY_CHANNEL = "templates_updated"
+
+RECONNECT_DELAY_SECONDS = 5
+
+# How long to wait for a notification before checking the listener connection
+# is still alive. Together with TCP keepalives this makes sure a silently
+# dropped connection is noticed and re-established.
+LISTEN_TIMEOUT_SECONDS = 60
+
+KEEPALIVE_PARAMS = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+
+@dataclass(frozen=True)
+class TemplateSnapshot:
+    """
+    Immutable copy of the template catalog at a given version.
+    """
+
+    version: int
+    templates: dict = field(default_factory=dict)  # content -> metadata
+    storage_mode: str = None  # embedding storage mode the catalog was ingested with
+
+    def get(self, content):
+        return self.templates.get(content)
+
+    def find_by_subject(self, subject):
+        for content, metadata in self.templates.items():
+            if metadata.get("subject") == subject:
+                return content, metadata
+        return None
+
+
+_snapshot = TemplateSnapshot(version=0)
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """
+    Return the current template snapshot. Callers should read it once per request.
+    """
+    return _snapshot
+
+
+def prepare_catalog_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS template_catalog (
+            id boolean PRIMARY KEY DEFAULT true CHECK (id),
+            version bigint NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        "ALTER TABLE template_catalog ADD COLUMN IF NOT EXISTS storage_mode text"
+    )
+
+
+def publish_catalog_update(cursor, storage_mode):
+    """
+    Bump the catalog version, record the embedding storage mode and queue a
+    NOTIFY. Call this in the same transaction that replaces the templates;
+    Postgres only delivers the notification once that transaction commits.
+    """
+    prepare_catalog_table(cursor)
+    cursor.execute(
+        """
+        INSERT INTO template_catalog (id, version, storage_mode) VALUES (true, 1, %s)
+        ON CONFLICT (id) DO UPDATE
+        SET version = template_catalog.version + 1, storage_mode = EXCLUDED.storage_mode
+        RETURNING version
+        """,
+        (storage_mode,),
+    )
+    version = cursor.fetchone()[0]
+    cursor.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, str(version)))
+    return version
+
+
+def load_snapshot(db_connection):
+    """
+    Read the catalog version and all templates in a single repeatable read transaction.
+    """
+    with psycopg.connect(db_connection) as conn:
+        conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('template_catalog') IS NOT NULL")
+            version, storage_mode = 0, None
+            if cursor.fetchone()[0]:
+                cursor.execute("SELECT version, storage_mode FROM template_catalog")
+                row = cursor.fetchone()
+                if row:
+                    version, storage_mode = row
+            cursor.execute("SELECT content, metadata FROM templates")
+            templates = {content: metadata for content, metadata in cursor.fetchall()}
+    return TemplateSnapshot(
+        version=version, templates=templates, storage_mode=storage_mode
+    )
+
+
+def refresh_snapshot(db_connection):
+    """
+    Load the catalog and swap it in, unless an equal or newer version is already active.
+    """
+    global _snapshot
+    snapshot = load_snapshot(db_connection)
+    # The listener and request handlers can load concurrently, so compare and
+    # swap under a lock to never replace a newer version with an older one.
+    # Readers do not take the lock: rebinding the module global is atomic, so
+    # requests see either the old or the new snapshot, never a mix of both.
+    with _snapshot_lock:
+        if snapshot.version > _snapshot.version or (
+            snapshot.version == _snapshot.version and not _snapshot.templates
+        ):
+            _snapshot = snapshot
+            print(
+                f"Template catalog version {snapshot.version} loaded "
+                f"({len(snapshot.templates)} templates, "
+                f"{snapshot.storage_mode or 'unrecorded'} storage)"
+            )
+        return _snapshot
+
+
+def _listen_for_updates(db_connection):
+    while True:
+        try:
+            with psycopg.connect(
+                db_connection, autocommit=True, **KEEPALIVE_PARAMS
+            ) as conn:
+                conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Reload after (re)connecting in case a notification was missed.
+                refresh_snapshot(db_connection)
+                while True:
+                    for notify in conn.notifies(timeout=LISTEN_TIMEOUT_SECONDS):
+                        print(
+                            f"Template catalog update received (version {notify.payload})"
+                        )
+                        refresh_snapshot(db_connection)
+                    # Raises if the connection was dropped, so we reconnect.
+                    conn.execute("SELECT 1")
+        except Exception as e:
+            print("Template catalog listener error:", str(e))
+            time.sleep(RECONNECT_DELAY_SECONDS)
+
+
+def start_catalog_listener(db_connection):
+    """
+    Start a background thread that loads the snapshot and reloads it on NOTIFY.
+    The first load also happens on that thread, so an unreachable database
+    does not stop the app from starting.
+    """
+    thread = threading.Thread(
+        target=_listen_for_updates,
+        args=(db_connection,),
+        name="template-catalog-listener",
+        daemon=True,
+    )
+    thread.start()
+    return thread